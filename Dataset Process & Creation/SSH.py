@@ -1,4 +1,4 @@
-import requests
+from download_session import CHUNK_BYTES, make_pooled_session
 
 # Define region and time (adjust as needed)
 lat_min, lat_max = -10, 10
@@ -15,14 +15,16 @@ url = (
     "&format=application/x-netcdf4"
 )
 
+# Pooled keep-alive session (retries handled by the adapter)
+session = make_pooled_session(auth=('sogu7', '@aA123B45C6D7E8'))  # you need Earthdata login
+
 # Download
 out_file = "SSH_subset.nc"
-session = requests.Session()
-session.auth = ('sogu7', '@aA123B45C6D7E8')  # you need Earthdata login
 resp = session.get(url, stream=True)
 
-with open(out_file, "wb") as f:
-    for chunk in resp.iter_content(chunk_size=8192):
-        f.write(chunk)
+with open(out_file, "wb", buffering=CHUNK_BYTES) as f:
+    for chunk in resp.iter_content(chunk_size=CHUNK_BYTES):
+        if chunk:
+            f.write(chunk)
 
 print(f"Downloaded: {out_file}")
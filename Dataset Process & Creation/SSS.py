@@ -1,5 +1,5 @@
 import os
-import subprocess
+from download_and_attach_sss import download_collection
 
 # Output directory
 out_dir = "./data_sss"
@@ -15,28 +15,10 @@ end_date = "2025-09-10T23:59:59Z"
 # Bounding box (lonW, latS, lonE, latN)
 lonW, latS, lonE, latN = -180, -90, 180, 90  # Global coverage
 
-# Build podaac-data-downloader command
-cmd = [
-    "podaac-data-downloader",
-    "-c", collection,
-    "-d", out_dir,
-    "--start-date", start_date,
-    "--end-date", end_date,
-    "-b", str(lonW), str(latS), str(lonE), str(latN),  # Separate bbox values
-    "-e", ".nc"  # Specify the file extension
-]
-
-# --- DEBUGGING STEP ---
-# Print the command list to see exactly what is being run
-print("DEBUG - Command list being executed:", cmd)
-print("-" * 30)
-
-# Running the command and handling errors
-try:
-    print("Running command:", " ".join(cmd))
-    result = subprocess.run(cmd, check=True, text=True, capture_output=True)
-    print("Command output:", result.stdout)
-except subprocess.CalledProcessError as e:
-    print(f"Error running command: {e}")
-    print(f"Standard Output:\n{e.stdout}")
-    print(f"Standard Error:\n{e.stderr}")
+# Search CMR and download in-process (shares the pooled, retrying session)
+local_files = download_collection(
+    collection, start_date, end_date,
+    bbox=(lonW, latS, lonE, latN),
+    out_dir=out_dir
+)
+print(f"{len(local_files)} granules available in {out_dir}")
@@ -1,8 +1,15 @@
 import os
-import requests
+import logging
+import asyncio
+import aiohttp
 import pandas as pd
 from netrc import netrc
-import time
+from checksum_cache import write_checksum, is_verified
+from download_session import CHUNK_BYTES
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s",
+                    handlers=[logging.StreamHandler()])
+log = logging.getLogger(__name__)
 
 # ==============================================================================
 # STEP 1: CONFIGURATION
@@ -27,19 +34,19 @@ BASE_URL = "https://oceandata.sci.gsfc.nasa.gov/ob/getfile/"
 try:
     auth = netrc().authenticators("urs.earthdata.nasa.gov")
     USERNAME, _, PASSWORD = auth
-    print("✅ Successfully loaded Earthdata credentials from ~/.netrc file.")
+    log.info("✅ Successfully loaded Earthdata credentials from ~/.netrc file.")
 except (FileNotFoundError, TypeError):
-    print("❌ ERROR: Could not find or read the ~/.netrc file.")
-    print("   Please ensure the file exists and is formatted correctly with your Earthdata login.")
+    log.error("❌ ERROR: Could not find or read the ~/.netrc file.")
+    log.error("   Please ensure the file exists and is formatted correctly with your Earthdata login.")
     exit()
 
-session = requests.Session()
-session.auth = (USERNAME, PASSWORD)
+# Number of files downloaded concurrently over the shared connection pool
+MAX_CONCURRENT_DOWNLOADS = 8
 
 # ==============================================================================
 # STEP 2: DOWNLOAD FUNCTION
 # ==============================================================================
-def download_nc_file(start_date, retries=3):
+async def download_nc_file(session, sem, start_date, retries=3):
     """
     Downloads a single 8-day composite NetCDF file for a given start date.
     """
@@ -60,85 +67,105 @@ def download_nc_file(start_date, retries=3):
     url = BASE_URL + fname
     save_path = os.path.join(DATA_DIR, fname)
 
-    # Check if a valid file already exists
-    if os.path.exists(save_path) and os.path.getsize(save_path) > 10000:
-        print(f"✅ Already exists and is valid: {fname}")
+    # Check if a verified file already exists
+    if os.path.exists(save_path) and is_verified(save_path):
+        log.debug(f"✅ Already exists and is valid: {fname}")
         return save_path
 
-    # Attempt to download the file with retries
-    for attempt in range(1, retries + 1):
-        print(f"⬇️  Downloading {fname} (attempt {attempt}) ...")
-        try:
-            r = session.get(url, stream=True, timeout=90)
-
-            content_type = r.headers.get('Content-Type', '')
-            if 'text/html' in content_type:
-                print(f"❌ ERROR: Received an HTML page for {fname}. Filename may be incorrect.")
-                return None
-
-            if r.status_code == 200:
-                with open(save_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk:
-                            f.write(chunk)
-                
-                if os.path.getsize(save_path) > 10000:
-                    print(f"✅ Download complete: {fname}")
-                    return save_path
-                else:
-                    print(f"❌ ERROR: Downloaded file for {fname} is too small. Deleting.")
-                    os.remove(save_path)
-                    return None
-
-            elif r.status_code == 404:
-                print(f"⚠️ File not found on server: {fname} (skipping)")
-                with open(MISSING_LOG, "a") as log:
-                    log.write(f"{fname} (404 Not Found)\n")
-                return None
-
-            else:
-                print(f"⚠️ Failed: {fname} | Status {r.status_code} | Reason: {r.reason}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Network error for {fname}: {e}")
-
-        time.sleep(5)
-
-    print(f"❌ All download attempts failed for {fname}")
-    with open(MISSING_LOG, "a") as log:
-        log.write(f"{fname} (Max retries reached)\n")
+    async with sem:
+        # An unverified local copy is kept only if the server reports the same size
+        if os.path.exists(save_path):
+            remote_length, etag = None, ''
+            try:
+                async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=90)) as r:
+                    remote_length = r.headers.get('Content-Length')
+                    etag = r.headers.get('ETag', '')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning(f"⚠️ Could not check {fname} against the server: {e}")
+            if remote_length is not None and int(remote_length) == os.path.getsize(save_path):
+                write_checksum(save_path, etag)
+                log.debug(f"✅ Already exists and matches the server: {fname}")
+                return save_path
+            log.warning(f"⚠️ Local copy of {fname} is incomplete or stale. Re-downloading.")
+
+        # Attempt to download the file with retries
+        for attempt in range(1, retries + 1):
+            log.debug(f"⬇️  Downloading {fname} (attempt {attempt}) ...")
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=90)) as r:
+                    content_type = r.headers.get('Content-Type', '')
+                    if 'text/html' in content_type:
+                        log.error(f"❌ ERROR: Received an HTML page for {fname}. Filename may be incorrect.")
+                        return None
+
+                    if r.status == 200:
+                        with open(save_path, "wb", buffering=CHUNK_BYTES) as f:
+                            async for chunk in r.content.iter_chunked(CHUNK_BYTES):
+                                await asyncio.to_thread(f.write, chunk)
+
+                        if os.path.getsize(save_path) > 10000:
+                            write_checksum(save_path, r.headers.get('ETag', ''))
+                            log.info(f"✅ Download complete: {fname}")
+                            return save_path
+                        else:
+                            log.error(f"❌ ERROR: Downloaded file for {fname} is too small. Deleting.")
+                            os.remove(save_path)
+                            return None
+
+                    elif r.status == 404:
+                        log.warning(f"⚠️ File not found on server: {fname} (skipping)")
+                        with open(MISSING_LOG, "a") as missing_log:
+                            missing_log.write(f"{fname} (404 Not Found)\n")
+                        return None
+
+                    else:
+                        log.warning(f"⚠️ Failed: {fname} | Status {r.status} | Reason: {r.reason}")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning(f"⚠️ Network error for {fname}: {e}")
+
+            await asyncio.sleep(5)
+
+    log.error(f"❌ All download attempts failed for {fname}")
+    with open(MISSING_LOG, "a") as missing_log:
+        missing_log.write(f"{fname} (Max retries reached)\n")
     return None
 
+async def main(dates_to_download):
+    """
+    Downloads all periods concurrently over a single authenticated session.
+    """
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_DOWNLOADS, ssl=True)
+    auth = aiohttp.BasicAuth(USERNAME, PASSWORD)
+    async with aiohttp.ClientSession(connector=connector, auth=auth) as session:
+        results = await asyncio.gather(*(download_nc_file(session, sem, d) for d in dates_to_download))
+    return [path for path in results if path]
+
 # ==============================================================================
 # STEP 3: MAIN DOWNLOAD LOOP (CORRECTED DATE GENERATION)
 # ==============================================================================
 
 # --- Robustly generate the list of start dates for each 8-day period ---
-print("-> Generating correct list of 8-day period start dates...")
-all_start_dates = []
-for year in range(overall_start_date.year, overall_end_date.year + 1):
-    # For each year, generate the sequence of 8-day periods starting from Jan 1st
-    year_dates = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="8D")
-    all_start_dates.extend(year_dates)
-
-# Filter the complete list to only include periods within our overall date range
-dates_to_download = [
-    d for d in all_start_dates 
-    if d >= overall_start_date and d <= overall_end_date
+log.info("-> Generating correct list of 8-day period start dates...")
+# Periods restart on Jan 1st every year, so build one 8-day index per year and join them
+years = range(overall_start_date.year, overall_end_date.year + 1)
+all_start_dates = pd.DatetimeIndex([]).append(
+    [pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="8D") for year in years]
+)
+
+# Filter the complete index to only include periods within our overall date range
+dates_to_download = all_start_dates[
+    (all_start_dates >= overall_start_date) & (all_start_dates <= overall_end_date)
 ]
-print(f"   Generated {len(dates_to_download)} periods to download.")
+log.info(f"   Generated {len(dates_to_download)} periods to download.")
 
 
-print(f"\n--- Starting Download Process for {len(dates_to_download)} 8-Day Periods ---")
-nc_files = []
-for i, d in enumerate(dates_to_download, start=1):
-    print(f"\n--- Processing Period {i}/{len(dates_to_download)}: Starting {d.date()} ---")
-    file_path = download_nc_file(d)
-    if file_path:
-        nc_files.append(file_path)
+log.info(f"--- Starting Download Process for {len(dates_to_download)} 8-Day Periods ---")
+nc_files = asyncio.run(main(dates_to_download))
 
-print("\n\n✅ All downloads processed!")
-print(f"Successfully downloaded: {len(nc_files)} files.")
-print(f"Data saved to the '{DATA_DIR}' folder.")
+log.info("✅ All downloads processed!")
+log.info(f"Successfully downloaded: {len(nc_files)} files.")
+log.info(f"Data saved to the '{DATA_DIR}' folder.")
 if len(nc_files) < len(dates_to_download):
-    print(f"Any missing or failed files have been logged to: {MISSING_LOG}")
+    log.info(f"Any missing or failed files have been logged to: {MISSING_LOG}")
@@ -0,0 +1,28 @@
+# Shared by the downloaders: records (etag, length, mtime) per downloaded file in a
+# "checksums" folder next to it, so a finished download is verified only once.
+import os
+
+def _checksum_path(save_path):
+    return os.path.join(os.path.dirname(save_path), "checksums", os.path.basename(save_path) + ".txt")
+
+def write_checksum(save_path, etag=""):
+    """
+    Records (etag, length, mtime) for a downloaded file so it is verified only once.
+    """
+    path = _checksum_path(save_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    st = os.stat(save_path)
+    with open(path, "w") as f:
+        f.write(f"{etag}\t{st.st_size}\t{st.st_mtime}")
+
+def is_verified(save_path):
+    """
+    True if the local file still matches the length and mtime recorded after its download.
+    """
+    try:
+        with open(_checksum_path(save_path)) as f:
+            _, length, mtime = f.read().split("\t")
+        st = os.stat(save_path)
+        return int(length) == st.st_size and float(mtime) == st.st_mtime
+    except (OSError, ValueError):
+        return False
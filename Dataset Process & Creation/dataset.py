@@ -1,7 +1,16 @@
 import os
+import logging
 import requests
+import numpy as np
 import xarray as xr
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from download_session import CHUNK_BYTES, make_pooled_session
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s",
+                    handlers=[logging.StreamHandler()])
+log = logging.getLogger(__name__)
 
 # -----------------------
 # CONFIGURATION
@@ -16,6 +25,18 @@ dates = pd.date_range("2023-06-24", "2025-09-10", freq="D")
 # NASA OceanColor base URL (MODIS Aqua Chlorophyll-a, 4km, daily L3m)
 BASE_URL = "https://oceandata.sci.gsfc.nasa.gov/cgi/getfile/"
 
+# Output Parquet file (written one row group per input file)
+OUT_FILE = "shark_habitat_dataset.parquet"
+SCHEMA = pa.schema([
+    ("date", pa.string()),
+    ("lat", pa.float32()),
+    ("lon", pa.float32()),
+    ("chlor_a", pa.float32())
+])
+
+# One pooled keep-alive session for every download (retries handled by the adapter)
+session = make_pooled_session()
+
 # -----------------------
 # DOWNLOAD FILES
 # -----------------------
@@ -25,15 +46,23 @@ def download_nc_file(date):
     save_path = os.path.join(DATA_DIR, fname)
     
     if not os.path.exists(save_path):
-        print(f"Downloading {fname} ...")
-        r = requests.get(url)
-        if r.status_code == 200:
-            with open(save_path, "wb") as f:
-                f.write(r.content)
-        else:
-            print(f"⚠️ Could not download {fname} (status {r.status_code})")
+        log.debug(f"Downloading {fname} ...")
+        try:
+            r = session.get(url, stream=True, timeout=60)
+            if r.status_code == 200:
+                with open(save_path, "wb", buffering=CHUNK_BYTES) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_BYTES):
+                        if chunk:
+                            f.write(chunk)
+            else:
+                log.warning(f"⚠️ Could not download {fname} (status {r.status_code})")
+        except requests.exceptions.RequestException as e:
+            # never leave a partial file behind: later runs trust any existing file
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            log.warning(f"⚠️ Could not download {fname} ({e})")
     else:
-        print(f"Already exists: {fname}")
+        log.debug(f"Already exists: {fname}")
     return save_path
 
 nc_files = [download_nc_file(d) for d in dates]
@@ -41,31 +70,34 @@ nc_files = [download_nc_file(d) for d in dates]
 # -----------------------
 # BUILD DATASET
 # -----------------------
-all_data = []
+total_rows = 0
 
-for file in nc_files:
-    try:
-        ds = xr.open_dataset(file)
-        chl = ds['chlor_a']
-        lat = ds['lat'].values
-        lon = ds['lon'].values
-        chl_data = chl.values
+with pq.ParquetWriter(OUT_FILE, schema=SCHEMA, compression="zstd") as writer:
+    for file in nc_files:
+        try:
+            ds = xr.open_dataset(file)
+            chl = ds['chlor_a']
+            lat = ds['lat'].values.astype(np.float32)
+            lon = ds['lon'].values.astype(np.float32)
+            chl_data = chl.values.astype(np.float32)
 
-        # Flatten into rows
-        for i in range(len(lat)):
-            for j in range(len(lon)):
-                all_data.append([
-                    file.split(".")[1],   # date string
-                    lat[i],
-                    lon[j],
-                    chl_data[i, j]
-                ])
-    except Exception as e:
-        print(f"⚠️ Skipping {file}: {e}")
+            # Flatten into rows (one vectorized frame per file)
+            lat2, lon2 = np.meshgrid(lat, lon, indexing='ij')
+            n = chl_data.size
+            date_col = np.full(n, file.split(".")[1], dtype=object)   # date string
+            df_part = pd.DataFrame({
+                "date": date_col,
+                "lat": lat2.ravel(),
+                "lon": lon2.ravel(),
+                "chlor_a": chl_data.ravel()
+            })
+            # Drop land/cloud-masked pixels
+            df_part = df_part.dropna(subset=["chlor_a"])
 
-# Convert to dataframe
-df = pd.DataFrame(all_data, columns=["date", "lat", "lon", "chlor_a"])
+            # Stream this file's rows straight to disk
+            writer.write_table(pa.Table.from_pandas(df_part, schema=SCHEMA, preserve_index=False))
+            total_rows += len(df_part)
+        except Exception as e:
+            log.warning(f"⚠️ Skipping {file}: {e}")
 
-# Save to CSV
-df.to_csv("shark_habitat_dataset.csv", index=False)
-print("✅ Dataset saved as shark_habitat_dataset.csv")
+log.info(f"✅ Dataset saved as {OUT_FILE} ({total_rows} rows)")
@@ -1,15 +1,25 @@
 # cmr_monthly_sss_downloader.py
 import os
+import logging
+import csv
 import time
 import math
 import json
+import asyncio
+import functools
+import httpx
 import requests
 import pandas as pd
 from netrc import netrc
 from datetime import datetime
+from email.utils import formatdate
 from dateutil.relativedelta import relativedelta
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from checksum_cache import write_checksum, is_verified
+from download_session import CHUNK_BYTES, make_pooled_session
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s",
+                    handlers=[logging.StreamHandler()])
+log = logging.getLogger(__name__)
 
 # -------- CONFIG --------
 SHORT_NAME = "SMAP_RSS_L3_SSS_SMI_8DAY-RUNNINGMEAN_V5"  # adjust if you use V6
@@ -21,20 +31,10 @@ os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 CMR_GRANULES = "https://cmr.earthdata.nasa.gov/search/granules.json"
 OUT_INDEX = "granules_index.csv"   # will store href, granule_id, time_start, time_end, local_path
-
-# -------- session with retries/backoff --------
-def make_session(user=None, pwd=None):
-    sess = requests.Session()
-    retries = Retry(total=6, backoff_factor=1.0,
-                    status_forcelist=[429, 500, 502, 503, 504],
-                    allowed_methods=["GET", "POST"])
-    adapter = HTTPAdapter(max_retries=retries)
-    sess.mount("https://", adapter)
-    sess.mount("http://", adapter)
-    sess.headers.update({"User-Agent": "Sharko-SSS-Downloader/1.0"})
-    if user and pwd:
-        sess.auth = (user, pwd)
-    return sess
+INDEX_FIELDS = ["granule_id", "href", "time_start", "time_end", "local_path"]
+CMR_CACHE_DIR = "cmr_cache"        # granule lists of closed monthly windows
+CMR_CACHE_MAX_AGE_DAYS = 30
+CMR_MAX_CONCURRENT = 5             # monthly windows queried at once over one HTTP/2 connection
 
 # load credentials from .netrc if present
 try:
@@ -46,7 +46,9 @@ try:
 except Exception:
     USER = PWD = None
 
-session = make_session(USER, PWD)
+# -------- session with retries/backoff --------
+session = make_pooled_session(auth=(USER, PWD) if USER and PWD else None,
+                              user_agent="Sharko-SSS-Downloader/1.0")
 
 # -------- helper: generate monthly windows --------
 def month_windows(start_iso, end_iso):
@@ -65,63 +67,122 @@ def month_windows(start_iso, end_iso):
         cur = next_month
     return windows
 
-# -------- fetch granules for a single temporal window (with pagination) --------
-def fetch_granules_for_window(short_name, start, end, provider=PROVIDER, page_size=200):
-    found = []
-    page_num = 1
-    print(f"  Querying CMR: {start} -> {end}")
-    while True:
-        params = {
-            "short_name": short_name,
-            "temporal": f"{start},{end}",
-            "provider": provider,
-            "page_size": page_size,
-            "page_num": page_num
-        }
+# -------- cache granule lists of closed windows (their CMR results no longer change) --------
+def cache_closed_windows(func):
+    @functools.wraps(func)
+    async def wrapper(short_name, start, end, *args, **kwargs):
+        bbox = kwargs.get("bbox")
+        suffix = "_" + "_".join(str(v) for v in bbox) if bbox else ""
+        # the end is part of the key: the last window is clipped to END and may be shorter
+        window = f"{start[:7]}_{end.replace(':', '')}"
+        path = os.path.join(CMR_CACHE_DIR, f"{short_name}_{window}{suffix}.json")
+        closed = pd.to_datetime(end) < pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=1)
+        if closed and os.path.exists(path) and \
+                time.time() - os.path.getmtime(path) < CMR_CACHE_MAX_AGE_DAYS * 86400:
+            log.info(f"  Using cached CMR results: {start} -> {end}")
+            with open(path) as f:
+                return json.load(f)
         try:
-            r = session.get(CMR_GRANULES, params=params, timeout=120)  # generous timeout
+            found = await func(short_name, start, end, *args, **kwargs)
+        except httpx.HTTPError as e:
+            # nothing is cached for a failed query, caller can retry
+            log.error(f"    ERROR querying CMR: {e}")
+            return []
+        # an empty list is not cached: it is more likely a CMR hiccup than an empty month
+        if closed and found:
+            os.makedirs(CMR_CACHE_DIR, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(found, f)
+        return found
+    return wrapper
+
+# -------- fetch granules for a single temporal window (search-after pagination) --------
+@cache_closed_windows
+async def fetch_granules_for_window_async(short_name, start, end, client, sem, provider=PROVIDER, page_size=2000, bbox=None):
+    found = []
+    headers = {}
+    params = {
+        "short_name": short_name,
+        "temporal": f"{start},{end}",
+        "provider": provider,
+        "page_size": page_size
+    }
+    if bbox:
+        # (lonW, latS, lonE, latN), the order CMR expects
+        params["bounding_box"] = ",".join(str(v) for v in bbox)
+    async with sem:
+        log.info(f"  Querying CMR: {start} -> {end}")
+        while True:
+            r = await client.get(CMR_GRANULES, params=params, headers=headers)
             r.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print("    ERROR querying CMR:", e)
-            # return what we have so far, caller can retry
-            return found
-        js = r.json()
-        entries = js.get("feed", {}).get("entry", [])
-        if not entries:
-            break
-        for item in entries:
-            gran_id = item.get("title")
-            t0 = item.get("time_start")
-            t1 = item.get("time_end")
-            links = item.get("links", [])
-            for L in links:
-                href = L.get("href")
-                ltype = (L.get("type") or "").lower()
-                if not href: 
-                    continue
-                # consider netcdf links or ones that look like data (not metadata)
-                if href.lower().endswith(".nc") or "netcdf" in ltype or "application/x-netcdf" in ltype:
-                    found.append({"granule_id": gran_id, "href": href, "time_start": t0, "time_end": t1})
-        page_num += 1
-        # stop if fewer than page_size entries
-        if len(entries) < page_size:
-            break
+            js = r.json()
+            entries = js.get("feed", {}).get("entry", [])
+            if not entries:
+                break
+            for item in entries:
+                gran_id = item.get("title")
+                t0 = item.get("time_start")
+                t1 = item.get("time_end")
+                links = item.get("links", [])
+                for L in links:
+                    href = L.get("href")
+                    ltype = (L.get("type") or "").lower()
+                    if not href: 
+                        continue
+                    # consider netcdf links or ones that look like data (not metadata)
+                    if href.lower().endswith(".nc") or "netcdf" in ltype or "application/x-netcdf" in ltype:
+                        found.append({"granule_id": gran_id, "href": href, "time_start": t0, "time_end": t1})
+            # CMR returns an opaque cursor for the next page; stop once it is absent
+            cursor = r.headers.get("CMR-Search-After")
+            if not cursor or len(entries) < page_size:
+                break
+            headers = {"CMR-Search-After": cursor}
     return found
 
+# -------- query all windows concurrently over one HTTP/2 client --------
+async def fetch_all_windows(short_name, windows, bbox=None):
+    sem = asyncio.Semaphore(CMR_MAX_CONCURRENT)
+    transport = httpx.AsyncHTTPTransport(http2=True, retries=6)
+    async with httpx.AsyncClient(transport=transport, timeout=120,
+                                 headers={"User-Agent": "Sharko-SSS-Downloader/1.0"}) as client:
+        return await asyncio.gather(*(fetch_granules_for_window_async(short_name, s, e, client, sem, bbox=bbox)
+                                      for (s, e) in windows))
+
 # -------- download helper (stream + retries handled by session adapter) --------
 def download_href(href, save_dir=DOWNLOAD_DIR):
     fname = os.path.basename(href.split("?")[0])
     save_path = os.path.join(save_dir, fname)
+    headers = {}
     if os.path.exists(save_path):
-        return save_path
+        if is_verified(save_path):
+            return save_path
+        # conditional GET: the server answers 304 if our copy is still current
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(save_path), usegmt=True)
     try:
-        r = session.get(href, stream=True, timeout=180)
+        r = session.get(href, stream=True, timeout=180, headers=headers)
+        if r.status_code == 304:
+            # a truncated copy has a newer mtime than the server's, so 304 alone is not
+            # enough: keep the local file only if the server reports the same size
+            r.close()
+            head = session.head(href, allow_redirects=True, timeout=60)
+            remote_length = head.headers.get("Content-Length")
+            if remote_length is not None and int(remote_length) == os.path.getsize(save_path):
+                write_checksum(save_path, head.headers.get("ETag", ""))
+                return save_path
+            log.warning(f"    Local copy of {fname} is incomplete or stale. Re-downloading.")
+            r = session.get(href, stream=True, timeout=180)
         ct = r.headers.get("Content-Type","")
         if r.status_code == 200 and (fname.lower().endswith(".nc") or "netcdf" in ct or "application" in ct):
-            with open(save_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            try:
+                with open(save_path, "wb", buffering=CHUNK_BYTES) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_BYTES):
+                        if chunk:
+                            f.write(chunk)
+            except requests.exceptions.RequestException:
+                # never leave a partial file behind for the next run to trust
+                os.remove(save_path)
+                raise
+            write_checksum(save_path, r.headers.get("ETag", ""))
             return save_path
         else:
             # save debug snippet if it's not a netcdf
@@ -129,48 +190,70 @@ def download_href(href, save_dir=DOWNLOAD_DIR):
             dbg = save_path + ".debug"
             with open(dbg, "wb") as f:
                 f.write(sample)
-            print("    Download returned non-netcdf content; saved debug snippet:", dbg)
+            log.warning(f"    Download returned non-netcdf content; saved debug snippet: {dbg}")
             return None
     except requests.exceptions.RequestException as e:
-        print("    Download error:", e)
+        log.warning(f"    Download error: {e}")
         return None
 
+# -------- index helper: append one row per download (header only for a new file) --------
+def append_index_row(row, path=OUT_INDEX):
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+        if os.path.getsize(path) == 0:
+            writer.writeheader()
+        writer.writerow(row)
+        f.flush()
+
 # -------- main: iterate windows, collect and download granules --------
-windows = month_windows(START, END)
-print(f"Will query {len(windows)} monthly windows.")
-
-# load existing index if present (resume)
-if os.path.exists(OUT_INDEX):
-    index_df = pd.read_csv(OUT_INDEX)
-else:
-    index_df = pd.DataFrame(columns=["granule_id","href","time_start","time_end","local_path"])
-
-all_new = []
-for (s,e) in windows:
-    g_list = fetch_granules_for_window(SHORT_NAME, s, e)
-    if not g_list:
-        print("  No granules found or query failed for window", s, e)
-        continue
-    # dedupe by href with index and existing
-    for g in g_list:
-        if ((index_df["href"] == g["href"]).any()) or any(x.get("href")==g["href"] for x in all_new):
+def download_collection(short_name, start, end, bbox=None, out_dir=DOWNLOAD_DIR):
+    """Downloads every granule of a collection in [start, end] (optionally within bbox)
+    and returns the local paths of the granules available on disk."""
+    os.makedirs(out_dir, exist_ok=True)
+    windows = month_windows(start, end)
+    log.info(f"Will query {len(windows)} monthly windows.")
+
+    # load href -> local_path of the existing index once if present (resume)
+    if os.path.exists(OUT_INDEX) and os.path.getsize(OUT_INDEX) > 0:
+        indexed = pd.read_csv(OUT_INDEX, usecols=["href", "local_path"])
+        seen_hrefs = dict(zip(indexed["href"], indexed["local_path"]))
+    else:
+        seen_hrefs = {}
+
+    local_paths = []
+    all_new = []
+    window_results = asyncio.run(fetch_all_windows(short_name, windows, bbox=bbox))
+    for (s,e), g_list in zip(windows, window_results):
+        if not g_list:
+            log.warning(f"  No granules found or query failed for window {s} {e}")
             continue
-        all_new.append(g)
-    # optional short sleep to be polite to CMR
-    time.sleep(1)
-
-print(f"Total new granule links found: {len(all_new)}")
-
-# Download the granules (can be restarted)
-for g in all_new:
-    href = g["href"]
-    print("Downloading:", href)
-    local = download_href(href)
-    row = { "granule_id": g["granule_id"], "href": href, "time_start": g["time_start"], "time_end": g["time_end"], "local_path": local }
-    index_df = index_df.append(row, ignore_index=True)
-    # persist index after each download
-    index_df.to_csv(OUT_INDEX, index=False)
-    # tiny pause
-    time.sleep(0.5)
-
-print("Done. See", OUT_INDEX, "and folder", DOWNLOAD_DIR)
+        # dedupe by href with index and existing
+        for g in g_list:
+            if g["href"] in seen_hrefs:
+                prev = seen_hrefs[g["href"]]
+                if isinstance(prev, str) and prev not in local_paths:
+                    local_paths.append(prev)
+                continue
+            seen_hrefs[g["href"]] = None
+            all_new.append(g)
+
+    log.info(f"Total new granule links found: {len(all_new)}")
+
+    # Download the granules (can be restarted)
+    for g in all_new:
+        href = g["href"]
+        log.info(f"Downloading: {href}")
+        local = download_href(href, save_dir=out_dir)
+        row = { "granule_id": g["granule_id"], "href": href, "time_start": g["time_start"], "time_end": g["time_end"], "local_path": local }
+        # persist index after each download
+        append_index_row(row)
+        if local:
+            local_paths.append(local)
+        # tiny pause
+        time.sleep(0.5)
+
+    log.info(f"Done. See {OUT_INDEX} and folder {out_dir}")
+    return local_paths
+
+if __name__ == "__main__":
+    download_collection(SHORT_NAME, START, END)
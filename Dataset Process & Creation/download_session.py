@@ -0,0 +1,24 @@
+# Shared by the downloaders: streaming chunk size and the pooled requests session.
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_BYTES = 1 << 20   # streaming chunk and write buffer size (1 MiB)
+
+def make_pooled_session(auth=None, total=6, user_agent=None):
+    """
+    One pooled keep-alive session for every download. Connect errors and 429/5xx
+    responses are retried with backoff by the adapter; errors while streaming a body are not.
+    """
+    sess = requests.Session()
+    retries = Retry(total=total, backoff_factor=1.0,
+                    status_forcelist=[429, 500, 502, 503, 504])
+    # a few host pools: data requests redirect through the Earthdata login host and back
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    if user_agent:
+        sess.headers.update({"User-Agent": user_agent})
+    if auth:
+        sess.auth = auth
+    return sess
@@ -1,11 +1,20 @@
 import os
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import xarray as xr
+import dask
+import dask.array as da
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from datetime import datetime
-import glob
 import sys
-from scipy.spatial import KDTree
+import h5py
+from sklearn.neighbors import BallTree
 
 # ==============================================================================
 # STEP 1: SETUP (UPDATED)
@@ -20,6 +29,15 @@ end_date_str = '2025-06-10'
 out_dir = "./final_model_data"
 os.makedirs(out_dir, exist_ok=True)
 
+# Extraction failures (with tracebacks) go to a rotating log file next to the output
+log = logging.getLogger(__name__)
+if __name__ == "__main__":
+    _log_handler = RotatingFileHandler(os.path.join(out_dir, 'final_dataset.log'),
+                                       maxBytes=1 << 20, backupCount=3)
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log.addHandler(_log_handler)
+    log.setLevel(logging.INFO)
+
 # UPDATED: Set the paths to your new 8-day composite data folders
 occurrence_file = r'C:\Sharko\Occurrence.tsv'
 chl_folder = r'C:\Sharko\chlorophyll_data_8day' # Changed
@@ -30,55 +48,76 @@ sss_folder = r'C:\Sharko\SSS_New'
 # ==============================================================================
 # STEP 2, 3, 4 (Unchanged)
 # ==============================================================================
-print("STEP 2: Loading and preparing shark presence data...")
-required_columns = ['eventDate', 'decimalLatitude', 'decimalLongitude']
-try:
-    presence_data = pd.read_csv(
-        occurrence_file, sep='\t', usecols=required_columns,
-        on_bad_lines='warn', low_memory=False
-    )
-except (FileNotFoundError, ValueError) as e:
-    print(f"Error loading the occurrence file: {e}")
-    raise
-presence_data.rename(columns={'eventDate': 'time', 'decimalLatitude': 'lat', 'decimalLongitude': 'lon'}, inplace=True)
-presence_data['time'] = pd.to_datetime(presence_data['time'], errors='coerce')
-presence_data.dropna(inplace=True)
-presence_data = presence_data[
-    (presence_data['time'] >= pd.to_datetime(start_date_str)) &
-    (presence_data['time'] <= pd.to_datetime(end_date_str))
-].reset_index(drop=True)
-print(f"-> Found {len(presence_data)} valid shark presence records.")
-
-print("STEP 3: Generating pseudo-absence data...")
-if len(presence_data) > 0:
-    # UPDATED: Generate twice as many pseudo-absence points as presence points (2:1 ratio).
-    # This gives the model a richer set of "background" environmental conditions to learn from.
-    num_pseudo_points = len(presence_data) * 2
-    min_lat, max_lat = presence_data['lat'].min(), presence_data['lat'].max()
-    min_lon, max_lon = presence_data['lon'].min(), presence_data['lon'].max()
-    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-    start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
-    pseudo_lats = np.random.uniform(min_lat, max_lat, num_pseudo_points)
-    pseudo_lons = np.random.uniform(min_lon, max_lon, num_pseudo_points)
-    random_timestamps = np.random.randint(start_ts, end_ts, num_pseudo_points)
-    pseudo_times = pd.to_datetime(random_timestamps, unit='s')
-    pseudo_absence_data = pd.DataFrame({'time': pseudo_times, 'lat': pseudo_lats, 'lon': pseudo_lons})
-    print(f"-> Generated {len(pseudo_absence_data)} pseudo-absence points.")
-else:
-    pseudo_absence_data = pd.DataFrame(columns=['time', 'lat', 'lon'])
-
-print("STEP 4: Combining presence and absence data...")
-presence_data['presence'] = 1
-pseudo_absence_data['presence'] = 0
-combined_points = pd.concat([presence_data, pseudo_absence_data], ignore_index=True)
-print(f"-> Created a combined dataset with {len(combined_points)} total points.")
+# Guarded so extraction worker processes (STEP 6) do not re-run the data loading
+if __name__ == "__main__":
+    print("STEP 2: Loading and preparing shark presence data...")
+    required_columns = ['eventDate', 'decimalLatitude', 'decimalLongitude']
+
+    def _warn_bad_line(row):
+        print(f"   ⚠️ WARNING: Skipping malformed line {row.number}: {row.text[:80]!r}")
+        return 'skip'
+
+    try:
+        # Multi-threaded Arrow parser; only the required columns are converted
+        presence_table = pacsv.read_csv(
+            occurrence_file,
+            parse_options=pacsv.ParseOptions(delimiter='\t', invalid_row_handler=_warn_bad_line),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=required_columns,
+                column_types={'eventDate': pa.string(),
+                              'decimalLatitude': pa.float32(), 'decimalLongitude': pa.float32()}
+            )
+        )
+        presence_data = presence_table.to_pandas()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading the occurrence file: {e}")
+        raise
+    presence_data.rename(columns={'eventDate': 'time', 'decimalLatitude': 'lat', 'decimalLongitude': 'lon'}, inplace=True)
+    # GBIF eventDate is ISO-8601; an explicit format keeps parsing on the fast vectorized path
+    presence_data['time'] = pd.to_datetime(
+        presence_data['time'], format='ISO8601', errors='coerce', utc=True
+    ).dt.tz_localize(None)
+    presence_data.dropna(inplace=True)
+    presence_data = presence_data[
+        (presence_data['time'] >= pd.to_datetime(start_date_str)) &
+        (presence_data['time'] <= pd.to_datetime(end_date_str))
+    ].reset_index(drop=True)
+    print(f"-> Found {len(presence_data)} valid shark presence records.")
+
+    print("STEP 3: Generating pseudo-absence data...")
+    RNG = np.random.default_rng(42)  # seeded PCG64 generator for reproducible pseudo-absences
+    if len(presence_data) > 0:
+        # UPDATED: Generate twice as many pseudo-absence points as presence points (2:1 ratio).
+        # This gives the model a richer set of "background" environmental conditions to learn from.
+        num_pseudo_points = len(presence_data) * 2
+        min_lat, max_lat = presence_data['lat'].min(), presence_data['lat'].max()
+        min_lon, max_lon = presence_data['lon'].min(), presence_data['lon'].max()
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+        start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+        pseudo_coords = RNG.uniform([min_lat, min_lon], [max_lat, max_lon], size=(num_pseudo_points, 2))
+        random_timestamps = RNG.integers(start_ts, end_ts, size=num_pseudo_points)
+        pseudo_times = pd.to_datetime(random_timestamps, unit='s', cache=True)
+        pseudo_absence_data = pd.DataFrame({'time': pseudo_times, 'lat': pseudo_coords[:, 0], 'lon': pseudo_coords[:, 1]})
+        print(f"-> Generated {len(pseudo_absence_data)} pseudo-absence points.")
+    else:
+        pseudo_absence_data = pd.DataFrame(columns=['time', 'lat', 'lon'])
+
+    print("STEP 4: Combining presence and absence data...")
+    presence_data['presence'] = 1
+    pseudo_absence_data['presence'] = 0
+    combined_points = pd.concat([presence_data, pseudo_absence_data], ignore_index=True)
+    # Compact dtypes: float32 coords, int8 label, day-resolution time
+    combined_points = combined_points.astype({'lat': 'float32', 'lon': 'float32', 'presence': 'int8'})
+    combined_points['time'] = pd.to_datetime(combined_points['time']).dt.floor('D')
+    print(f"-> Created a combined dataset with {len(combined_points)} total points.")
 
 
 # ==============================================================================
 # STEP 5: LOAD SATELLITE DATA (UPDATED)
 # ==============================================================================
-print("STEP 5: Loading satellite data functions...")
+if __name__ == "__main__":
+    print("STEP 5: Loading satellite data functions...")
 
 def _build_time_coordinate_from_filenames(ds, files):
     """
@@ -87,7 +126,11 @@ def _build_time_coordinate_from_filenames(ds, files):
     # Assumes filename format like '...YYYYMMDD_YYYYMMDD...'
     try:
         # We parse the START date of the 8-day period from the filename
-        times = [pd.to_datetime(os.path.basename(f).split('.')[1].split('_')[0], format='%Y%m%d') for f in files]
+        basenames = pd.Series([os.path.basename(f) for f in files])
+        stamps = basenames.str.extract(r'\.(\d{8})', expand=False)
+        times = pd.to_datetime(stamps, format='%Y%m%d')
+        if times.isna().any(): raise ValueError("Filename without a YYYYMMDD date.")
+        times = times.values
         ds = ds.assign_coords(time=times)
         print("      -> Successfully built time coordinate from filenames.")
         return ds
@@ -95,22 +138,48 @@ def _build_time_coordinate_from_filenames(ds, files):
         print("      ⚠️ WARNING: Could not build time coordinate from filenames.")
         return ds
 
-def open_multifile_dataset(folder_path, lat_bounds, lon_bounds, needs_time_coord=False):
-    search_pattern = os.path.join(folder_path, '*.nc')
-    file_list = glob.glob(search_pattern)
+# Dask chunking per file: gridded composites are tiled per time step, while track files
+# (whose sample dimension is 'time') are kept as one chunk each, not one per sample
+GRID_CHUNKS = {'time': 1, 'lat': 1024, 'lon': 1024}
+TRACK_CHUNKS = -1
+
+def open_multifile_dataset(folder_path, lat_bounds, lon_bounds, needs_time_coord=False, chunks=GRID_CHUNKS):
+    file_list = [e.path for e in os.scandir(folder_path) if e.is_file() and e.name.endswith('.nc')]
+    # Sorted so the nested concat (and filename-built time coordinate) is chronological
+    file_list.sort()
     if not file_list: raise FileNotFoundError(f"No '.nc' files found in '{folder_path}'.")
 
     print(f"   Found {len(file_list)} files in {os.path.basename(folder_path)}. Verifying...")
+    # Files already verified with the same (size, mtime) are trusted without re-checking
+    cache_path = os.path.join(folder_path, '.valid_cache.json')
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as fh: cache = json.load(fh)
+
+    # Cheap signature check instead of opening every file twice
     valid_files = []
     for f in file_list:
-        try:
-            with xr.open_dataset(f): valid_files.append(f)
-        except Exception:
+        st = os.stat(f)
+        key = os.path.basename(f)
+        if cache.get(key) == [st.st_size, st.st_mtime]:
+            valid_files.append(f)
+        elif st.st_size > 10_000 and h5py.is_hdf5(f):
+            cache[key] = [st.st_size, st.st_mtime]
+            valid_files.append(f)
+        else:
+            cache.pop(key, None)
             print(f"   ⚠️ WARNING: Skipping corrupted file: {os.path.basename(f)}")
+    with open(cache_path, 'w') as fh: json.dump(cache, fh)
     if not valid_files: raise ValueError(f"No valid .nc files found in {folder_path}.")
 
     print(f"   -> Opening {len(valid_files)} valid files...")
-    ds = xr.open_mfdataset(valid_files, combine='nested', concat_dim="time", join='override')
+    # coords='minimal' + compat='override' take the shared lat/lon from the first file
+    # instead of reading and comparing them across every file
+    ds = xr.open_mfdataset(
+        valid_files, combine='nested', concat_dim="time", join='override',
+        coords='minimal', compat='override',
+        parallel=True, engine='h5netcdf', chunks=chunks
+    )
     
     if needs_time_coord:
         ds = _build_time_coordinate_from_filenames(ds, valid_files)
@@ -138,101 +207,263 @@ def open_multifile_dataset(folder_path, lat_bounds, lon_bounds, needs_time_coord
 # ==============================================================================
 # STEP 6: EXTRACT ENVIRONMENTAL DATA (UNCHANGED LOGIC)
 # ==============================================================================
-print("\nSTEP 6: Extracting environmental data for each variable...")
+# sin/cos of the seasonal angle for every possible day of year, indexed by day number
+SIN_LUT = np.sin(2 * np.pi * np.arange(367) / 365).astype(np.float32)
+COS_LUT = np.cos(2 * np.pi * np.arange(367) / 365).astype(np.float32)
+
+# Points extracted per batch, bounding the size of each intermediate result
+EXTRACT_CHUNK = 50_000
+
+# Track matching: each lookup point takes the great-circle nearest satellite sample
+# within +/- TRACK_TIME_WINDOW_NS of its own time. Lookup points are grouped in
+# non-overlapping blocks of TRACK_TREE_BLOCK_NS sharing one BallTree (each sample
+# goes into ~3 trees instead of one per lookup day); the tree returns the k nearest
+# candidates and those outside the point's window are discarded.
+# Times are compared as raw datetime64[ns] integers, so the constants are in ns.
+DAY_NS = 86_400 * 10**9
+TRACK_TIME_WINDOW_NS = 5 * DAY_NS    # +/- 5 days around each point
+TRACK_TREE_BLOCK_NS = 5 * DAY_NS     # lookup days sharing one tree
+TRACK_QUERY_K = 16                   # first candidates per point; grown x4 if none are in its window
+TRACK_MATCH_VERSION = 2              # part of the on-disk cache key; bump when matching changes
 
-def _extract_track_data_with_kdtree(ds, variable, lookup_df):
+def _extract_track_data_with_balltree(ds, variable, time_arr, lat_arr, lon_arr):
     """
-    Uses a KD-Tree for fast nearest-neighbor search on non-gridded data (like SSHA).
+    Time-windowed haversine BallTree nearest-neighbor search on non-gridded data (like SSHA).
     """
-    print(f"   Using specialized KD-Tree for track data...")
-    sat_time = ds['time'].values.astype(np.int64) // 10**9 
-    sat_lat = ds['lat'].values
-    sat_lon = ds['lon'].values
-    sat_points = np.vstack([sat_time, sat_lat, sat_lon]).T
+    print(f"   Using time-windowed haversine BallTree for track data...")
+    # Satellite samples sorted by time once, so each window is a contiguous slice
+    sat_time = ds['time'].values.astype('datetime64[ns]', copy=False).view(np.int64)
+    order = np.argsort(sat_time, kind='stable')
+    sat = {
+        'order': order,
+        'time': sat_time[order],
+        'rad': np.radians(np.column_stack([ds['lat'].values[order], ds['lon'].values[order]]).astype(np.float64)),
+    }
     
-    lookup_time = lookup_df['time'].values.astype(np.int64) // 10**9
-    lookup_lat = lookup_df['lat'].values
-    lookup_lon = lookup_df['lon'].values
-    lookup_points = np.vstack([lookup_time, lookup_lat, lookup_lon]).T
+    lookup_time = time_arr.astype('datetime64[ns]', copy=False).view(np.int64)
+    lookup_rad = np.radians(np.column_stack([lat_arr, lon_arr]).astype(np.float64))
     
-    tree = KDTree(sat_points)
-    _, indices = tree.query(lookup_points, k=1)
+    var_values = ds[variable].values
+    out = np.full(len(lookup_time), np.nan, dtype=np.float32)
+    # Lookup points sorted by time (like the satellite samples), so each block is a
+    # contiguous run and consecutive blocks query neighbouring satellite windows
+    lookup_order = np.argsort(lookup_time, kind='stable')
+    bins = lookup_time[lookup_order] // TRACK_TREE_BLOCK_NS
+    block_bins, bin_starts = np.unique(bins, return_index=True)
+    bin_ends = np.append(bin_starts[1:], len(bins))
+    for b, first, last in zip(block_bins, bin_starts, bin_ends):
+        members = lookup_order[first:last]
+        lo = np.searchsorted(sat['time'], b * TRACK_TREE_BLOCK_NS - TRACK_TIME_WINDOW_NS, side='left')
+        hi = np.searchsorted(sat['time'], (b + 1) * TRACK_TREE_BLOCK_NS + TRACK_TIME_WINDOW_NS, side='right')
+        if lo == hi: continue  # no satellite pass near this block; values stay NaN
+        # Points with no sample in their own window stay NaN and are not queried
+        t = lookup_time[members]
+        in_window = (np.searchsorted(sat['time'], t + TRACK_TIME_WINDOW_NS, side='right')
+                     - np.searchsorted(sat['time'], t - TRACK_TIME_WINDOW_NS, side='left'))
+        members = members[in_window > 0]
+        if len(members) == 0: continue
+        tree = BallTree(sat['rad'][lo:hi], metric='haversine')
+        block_time = sat['time'][lo:hi]
+        for start in range(0, len(members), EXTRACT_CHUNK):
+            pending = members[start:start + EXTRACT_CHUNK]
+            k = min(TRACK_QUERY_K, hi - lo)
+            while len(pending):
+                # Candidates come back nearest first: take the first one inside the window
+                _, idx = tree.query(lookup_rad[pending], k=k)
+                ok = np.abs(block_time[idx] - lookup_time[pending][:, None]) <= TRACK_TIME_WINDOW_NS
+                found = ok.any(axis=1)
+                best = idx[found, ok[found].argmax(axis=1)]
+                out[pending[found]] = var_values[sat['order'][lo + best]]
+                # Every point left has a sample in its window, so a larger k finds it
+                pending = pending[~found]
+                k = min(k * 4, hi - lo)
     
-    return ds[variable].values[indices]
+    return out
+
+def _nearest_index(coord, values):
+    """
+    Index of the nearest entry of a monotonic 1-D coordinate for each value.
+    """
+    coord = np.asarray(coord)
+    if len(coord) == 1:
+        return np.zeros(len(values), dtype=np.intp)
+    descending = coord[0] > coord[-1]
+    if descending: coord = coord[::-1]
+    idx = np.clip(np.searchsorted(coord, values), 1, len(coord) - 1)
+    left, right = coord[idx - 1], coord[idx]
+    idx = np.where(values - left < right - values, idx - 1, idx)
+    return len(coord) - 1 - idx if descending else idx
+
+def _extract_gridded_data(ds, variable, time_arr, lat_arr, lon_arr):
+    """
+    Nearest-neighbor lookup on a regular grid through integer indices from the 1-D coords.
+    """
+    # searchsorted silently gives wrong indices where xarray's sel used to raise, so
+    # refuse an unlabeled time dimension (filename parsing failed) or unsorted coords
+    if not np.issubdtype(ds['time'].dtype, np.datetime64):
+        raise ValueError(f"'time' is not a datetime coordinate (dtype {ds['time'].dtype}).")
+    time_c = ds['time'].values.astype('datetime64[ns]', copy=False).view(np.int64)
+    lat_c = ds['lat'].values
+    lon_c = ds['lon'].values
+    for dim, coord in (('time', time_c), ('lat', lat_c), ('lon', lon_c)):
+        step = np.diff(coord)
+        if not (np.all(step > 0) or np.all(step < 0)):
+            raise ValueError(f"'{dim}' coordinate is not strictly monotonic.")
+
+    ti = _nearest_index(time_c, time_arr.view(np.int64))
+    yi = _nearest_index(lat_c, lat_arr)
+    xi = _nearest_index(lon_c, lon_arr)
 
-if len(combined_points) > 0:
-    lat_bounds = (presence_data['lat'].min(), presence_data['lat'].max())
-    lon_bounds = (presence_data['lon'].min(), presence_data['lon'].max())
+    # Gather straight from the backing array, bypassing xarray's indexing machinery.
+    # One gather for all points: on Dask-backed data vindex then reads each touched
+    # chunk once (the result is only N float32 values, so batching saves no memory).
+    data = ds[variable].transpose('time', 'lat', 'lon').data
+    if isinstance(data, da.Array):
+        values = data.vindex[ti, yi, xi].compute()
+    else:
+        values = data[ti, yi, xi]
+    return np.asarray(values, dtype=np.float32)
+
+# Worker processes for STEP 6, and the Dask threads each of them may use
+EXTRACT_WORKERS = 4
+DASK_THREADS_PER_WORKER = max(1, (os.cpu_count() or 1) // EXTRACT_WORKERS)
+
+def _track_cache_path(source, time_arr, lat_arr, lon_arr, lat_bounds, lon_bounds):
+    """
+    On-disk cache file for a track extraction, keyed by the input files, bounds and lookup points.
+    """
+    files = sorted((e.name, e.stat().st_size, e.stat().st_mtime_ns)
+                   for e in os.scandir(source['folder']) if e.is_file() and e.name.endswith('.nc'))
+    key = hashlib.sha1()
+    key.update(str((files, source['variable'], lat_bounds, lon_bounds,
+                       TRACK_TIME_WINDOW_NS, TRACK_MATCH_VERSION)).encode())
+    for arr in (time_arr, lat_arr, lon_arr):
+        key.update(np.ascontiguousarray(arr).tobytes())
+    return os.path.join(out_dir, f".cache_{source['variable']}_{key.hexdigest()}.npy")
+
+def extract_one(name, source, time_arr, lat_arr, lon_arr, lat_bounds, lon_bounds):
+    """
+    Opens one data source and extracts its variable at every lookup point (runs in a worker process).
+    """
+    print(f"\n-> Processing: {name}")
+    # Track extraction is the slow one: reuse the result of an identical earlier run
+    cache_path = None
+    if not source['is_gridded']:
+        cache_path = _track_cache_path(source, time_arr, lat_arr, lon_arr, lat_bounds, lon_bounds)
+        if os.path.exists(cache_path):
+            print(f"   Loaded cached '{source['variable']}' values from {cache_path}")
+            return np.load(cache_path)
+
+    ds = open_multifile_dataset(
+        source['folder'], lat_bounds, lon_bounds, 
+        needs_time_coord=source.get('needs_time', False),
+        chunks=GRID_CHUNKS if source['is_gridded'] else TRACK_CHUNKS
+    )
+    if ds is None: return None
+
+    print(f"   Extracting '{source['variable']}' values...")
+    # The dataset is lazy (Dask); only the chunks holding our points are read
+    with dask.config.set(scheduler='threads', num_workers=DASK_THREADS_PER_WORKER):
+        if source['is_gridded']:
+            # Regular grids need no tree: nearest indices come from the 1-D coords
+            extracted_values = _extract_gridded_data(ds, source['variable'], time_arr, lat_arr, lon_arr)
+        else: 
+            # Track data has no regular grid: tree search on great-circle distance
+            extracted_values = _extract_track_data_with_balltree(ds, source['variable'], time_arr, lat_arr, lon_arr)
+    extracted_values = np.asarray(extracted_values, dtype=np.float32)
+    if cache_path is not None:
+        np.save(cache_path, extracted_values)
+    return extracted_values
+
+if __name__ == "__main__":
+    print("\nSTEP 6: Extracting environmental data for each variable...")
+
+    if len(combined_points) > 0:
+        lat_bounds = (presence_data['lat'].min(), presence_data['lat'].max())
+        lon_bounds = (presence_data['lon'].min(), presence_data['lon'].max())
     
-    final_dataset = combined_points.copy()
+        # combined_points is not used after this point; columns are only added, so no copy is needed
+        final_dataset = combined_points
     
-    data_sources = {
-        'chlor_a': {'folder': chl_folder, 'variable': 'chlor_a', 'is_gridded': True, 'needs_time': True},
-        'sst':     {'folder': sst_folder, 'variable': 'sst', 'is_gridded': True, 'needs_time': True},
-        'ssha':    {'folder': ssh_folder, 'variable': 'ssha', 'is_gridded': False},
-        'sss':     {'folder': sss_folder, 'variable': 'sss_smap', 'is_gridded': True}
-    }
+        data_sources = {
+            'chlor_a': {'folder': chl_folder, 'variable': 'chlor_a', 'is_gridded': True, 'needs_time': True},
+            'sst':     {'folder': sst_folder, 'variable': 'sst', 'is_gridded': True, 'needs_time': True},
+            'ssha':    {'folder': ssh_folder, 'variable': 'ssha', 'is_gridded': False},
+            'sss':     {'folder': sss_folder, 'variable': 'sss_smap', 'is_gridded': True}
+        }
 
-    for name, source in data_sources.items():
-        print(f"\n-> Processing: {name}")
-        try:
-            ds = open_multifile_dataset(
-                source['folder'], lat_bounds, lon_bounds, 
-                needs_time_coord=source.get('needs_time', False)
-            )
-            
-            if ds is None: continue
-
-            print(f"   Extracting '{source['variable']}' values...")
-            if source['is_gridded']:
-                extracted_values = ds[source['variable']].sel(
-                    lat=xr.DataArray(final_dataset['lat'], dims='points'),
-                    lon=xr.DataArray(final_dataset['lon'], dims='points'),
-                    time=xr.DataArray(final_dataset['time'], dims='points'),
-                    method='nearest'
-                ).values
-            else: 
-                extracted_values = _extract_track_data_with_kdtree(ds, source['variable'], final_dataset)
-            
-            final_dataset[name] = extracted_values
-            print(f"   -> Done.")
-        except Exception as e:
-            print(f"   ❌ ERROR processing {name}. This variable will be skipped. Error: {e}")
-
-    # ==============================================================================
-    # STEP 7 & 8 (LOGIC ADJUSTED)
-    # ==============================================================================
-    print("\nSTEP 7: Finalizing dataset...")
-    final_dataset['day_of_year'] = final_dataset['time'].dt.dayofyear
-    final_dataset['day_sin'] = np.sin(2 * np.pi * final_dataset['day_of_year'] / 365)
-    final_dataset['day_cos'] = np.cos(2 * np.pi * final_dataset['day_of_year'] / 365)
-    final_dataset = final_dataset.drop(columns=['day_of_year'])
+        # Lookup coordinates as plain arrays, extracted once for every source
+        time_arr = final_dataset['time'].values.astype('datetime64[ns]')
+        lat_arr = final_dataset['lat'].to_numpy(dtype=np.float32)
+        lon_arr = final_dataset['lon'].to_numpy(dtype=np.float32)
+
+        # Sources are independent (one folder each), so they are extracted in parallel processes
+        results = {}
+        with ProcessPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(data_sources))) as ex:
+            futures = {ex.submit(extract_one, name, source, time_arr, lat_arr, lon_arr,
+                                 lat_bounds, lon_bounds): name
+                       for name, source in data_sources.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                    print(f"   -> Done: {name}")
+                except Exception as e:
+                    print(f"   ❌ ERROR processing {name}. This variable will be skipped. Error: {e}")
+                    log.exception(f"{name} extraction failed")
+
+        # Assign in data_sources order so the column layout does not depend on completion order;
+        # a failed or non-overlapping source gets no column (downstream treats it as optional)
+        extracted = [name for name in data_sources if results.get(name) is not None]
+        for name in extracted:
+            final_dataset[name] = results[name]
+
+        # ==============================================================================
+        # STEP 7 & 8 (LOGIC ADJUSTED)
+        # ==============================================================================
+        print("\nSTEP 7: Finalizing dataset...")
+        # Seasonal features looked up by day of year (1..366) from float32 tables
+        doy = final_dataset['time'].dt.dayofyear.values.astype(np.int32)
+        final_dataset['day_sin'] = SIN_LUT[doy]
+        final_dataset['day_cos'] = COS_LUT[doy]
     
-    print(f"   Original rows: {len(final_dataset)}")
-    final_dataset.dropna(inplace=True)
-    print(f"   Rows with complete data: {len(final_dataset)}")
-    print("-> Final dataset prepared.")
-
-    if not final_dataset.empty:
-        # --- NEW: Reorder columns to have 'presence' at the end ---
-        print("   Reordering columns for clarity...")
-        cols = final_dataset.columns.tolist()
-        # Move the 'presence' column to the very end of the list
-        cols.insert(len(cols), cols.pop(cols.index('presence')))
-        final_dataset = final_dataset[cols]
-        print("   Columns reordered.")
-
-        # BUG FIX: Ensure filename extension matches compression type
-        output_path = os.path.join(out_dir, 'model_training_dataset.csv.gz')
-        final_dataset.to_csv(output_path, index=False, compression='gzip')
-
-        print("\n" + "="*60)
-        print(f"✅ SUCCESS! Your model-ready dataset is saved to: {output_path}")
-        print("="*60)
-        print("\nFirst 5 rows of the final dataset:")
-        print(final_dataset.head())
+        print(f"   Original rows: {len(final_dataset)}")
+        # Only the extracted columns can hold NaN: one vectorized scan over them
+        if extracted:
+            env_values = np.column_stack([final_dataset[c].to_numpy(dtype=np.float32, copy=False) for c in extracted])
+            complete = ~np.isnan(env_values).any(axis=1)
+            final_dataset = final_dataset.loc[complete].reset_index(drop=True)
+        print(f"   Rows with complete data: {len(final_dataset)}")
+        print("-> Final dataset prepared.")
+
+        if not final_dataset.empty:
+            # --- NEW: Reorder columns to have 'presence' at the end ---
+            print("   Reordering columns for clarity...")
+            # Move the 'presence' column to the very end (in place, no frame copy)
+            final_dataset['presence'] = final_dataset.pop('presence')
+            print("   Columns reordered.")
+
+            # Columnar, zstd-compressed copy: much faster to write and to load back
+            parquet_path = os.path.join(out_dir, 'model_training_dataset.parquet')
+            final_dataset.to_parquet(parquet_path, engine='pyarrow', compression='zstd',
+                                     compression_level=3, index=False)
+
+            # BUG FIX: Ensure filename extension matches compression type
+            # (gzip CSV kept because the model notebook reads this file)
+            output_path = os.path.join(out_dir, 'model_training_dataset.csv.gz')
+            # Arrow's C++ CSV writer formats the numeric columns much faster than to_csv
+            table = pa.Table.from_pandas(final_dataset, preserve_index=False)
+            with pa.CompressedOutputStream(output_path, 'gzip') as out:
+                pacsv.write_csv(table, out)
+
+            print("\n" + "="*60)
+            print(f"✅ SUCCESS! Your model-ready dataset is saved to: {parquet_path}")
+            print(f"   (CSV copy: {output_path})")
+            print("="*60)
+            print("\nFirst 5 rows of the final dataset:")
+            print(final_dataset.head())
+        else:
+            print("\nWARNING: Final dataset is empty. No file saved.")
     else:
-        print("\nWARNING: Final dataset is empty. No file saved.")
-else:
-    print("\nNo data points found. No output file was created.")
+        print("\nNo data points found. No output file was created.")
 
@@ -1,8 +1,15 @@
 import os
+import logging
 import requests
 import pandas as pd
 from netrc import netrc
 import time
+from checksum_cache import write_checksum, is_verified
+from download_session import CHUNK_BYTES, make_pooled_session
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s",
+                    handlers=[logging.StreamHandler()])
+log = logging.getLogger(__name__)
 
 # -----------------------
 # CONFIGURATION
@@ -11,6 +18,7 @@ DATA_DIR = "chlorophyll_data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
 MISSING_LOG = os.path.join(DATA_DIR, "missing_files.txt")
+STREAM_RETRIES = 3      # attempts for downloads interrupted while streaming
 
 # Test with a short range first
 dates = pd.date_range("2024-01-01", "2025-09-10", freq="W-FRI")  
@@ -21,47 +29,69 @@ BASE_URL = "https://oceandata.sci.gsfc.nasa.gov/ob/getfile/"
 auth = netrc().authenticators("urs.earthdata.nasa.gov")
 USERNAME, ACCOUNT, PASSWORD = auth
 
-session = requests.Session()
-session.auth = (USERNAME, PASSWORD)
+# One pooled keep-alive session for every download (retries handled by the adapter)
+# (fewer adapter retries: interrupted streams are retried separately below)
+session = make_pooled_session(auth=(USERNAME, PASSWORD), total=3)
 
 # -----------------------
 # DOWNLOAD FUNCTION
 # -----------------------
-def download_nc_file(date, retries=3):
+def download_nc_file(date):
     fname = f"AQUA_MODIS.{date.strftime('%Y%m%d')}.L3m.DAY.CHL.chlor_a.4km.nc"
     url = BASE_URL + fname
     save_path = os.path.join(DATA_DIR, fname)
 
     if os.path.exists(save_path):
-        print(f"✅ Already exists: {fname}")
-        return save_path
+        if is_verified(save_path):
+            log.debug(f"✅ Already exists: {fname}")
+            return save_path
+        # An unverified local copy is kept only if the server reports the same size
+        try:
+            r = session.head(url, allow_redirects=True, timeout=60)
+            remote_length = r.headers.get("Content-Length")
+            if remote_length is not None and int(remote_length) == os.path.getsize(save_path):
+                write_checksum(save_path, r.headers.get("ETag", ""))
+                log.debug(f"✅ Already exists: {fname}")
+                return save_path
+        except requests.exceptions.RequestException as e:
+            log.warning(f"⚠️ Could not check {fname} against the server: {e}")
+        log.warning(f"⚠️ Local copy of {fname} is incomplete or stale. Re-downloading.")
 
-    for attempt in range(1, retries + 1):
-        print(f"⬇️  Downloading {fname} (attempt {attempt}) ...")
+    # Connection errors and 429/5xx responses are retried with backoff by the session adapter;
+    # errors while streaming the body are not, so those get a few attempts here
+    for attempt in range(1, STREAM_RETRIES + 1):
+        log.debug(f"⬇️  Downloading {fname} (attempt {attempt}) ...")
         try:
             r = session.get(url, stream=True, timeout=60)
-            if r.status_code == 200:
-                with open(save_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
+        except requests.exceptions.RequestException as e:
+            log.warning(f"⚠️ Network error for {fname}: {e}")
+            break
+        if r.status_code == 200:
+            try:
+                with open(save_path, "wb", buffering=CHUNK_BYTES) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_BYTES):
                         if chunk:
                             f.write(chunk)
-                print(f"✅ Download complete: {fname}")
-                return save_path
-            elif r.status_code == 404:
-                print(f"⚠️ File not found: {fname} (skipping)")
-                with open(MISSING_LOG, "a") as log:
-                    log.write(f"{fname}\n")
-                return None
-            else:
-                print(f"⚠️ Failed: {fname} | Status {r.status_code} | Type {r.headers.get('Content-Type')}")
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Network error for {fname}: {e}")
-
-        time.sleep(5)  # wait before retry
+            except requests.exceptions.RequestException as e:
+                os.remove(save_path)
+                log.warning(f"⚠️ Download of {fname} interrupted: {e}")
+                time.sleep(5)  # wait before retry
+                continue
+            write_checksum(save_path, r.headers.get("ETag", ""))
+            log.info(f"✅ Download complete: {fname}")
+            return save_path
+        elif r.status_code == 404:
+            log.warning(f"⚠️ File not found: {fname} (skipping)")
+            with open(MISSING_LOG, "a") as missing_log:
+                missing_log.write(f"{fname}\n")
+            return None
+        else:
+            log.warning(f"⚠️ Failed: {fname} | Status {r.status_code} | Type {r.headers.get('Content-Type')}")
+            break
 
-    print(f"❌ All attempts failed for {fname}")
-    with open(MISSING_LOG, "a") as log:
-        log.write(f"{fname} (network/error)\n")
+    log.error(f"❌ Download failed for {fname}")
+    with open(MISSING_LOG, "a") as missing_log:
+        missing_log.write(f"{fname} (network/error)\n")
     return None
 
 # -----------------------
@@ -69,10 +99,10 @@ def download_nc_file(date, retries=3):
 # -----------------------
 nc_files = []
 for i, d in enumerate(dates, start=1):
-    print(f"\n--- Processing {i}/{len(dates)}: {d.date()} ---")
+    log.debug(f"--- Processing {i}/{len(dates)}: {d.date()} ---")
     file_path = download_nc_file(d)
     if file_path:
         nc_files.append(file_path)
 
-print("\n✅ All downloads processed")
-print(f"Missing files logged to {MISSING_LOG}")
+log.info("✅ All downloads processed")
+log.info(f"Missing files logged to {MISSING_LOG}")